@@ -1,57 +1,111 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import subprocess
-import os
+from quart import Quart, Response, request, jsonify
+from quart_cors import cors
+from werkzeug.exceptions import RequestEntityTooLarge
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import orjson
 import logging
+import invoices
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Logging is configured by invoices, using the LOG_LEVEL environment variable
+logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
-CORS(app, resources={r"/process_orders": {"origins": "*"}})
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
 
-# Define the path to the invoices script
-INVOICES_SCRIPT_PATH = os.path.join(os.getcwd(), 'invoices.py')
+# Reject request bodies over 1 MB before they are parsed
+app.config['MAX_CONTENT_LENGTH'] = 1_000_000
+
+# Thread pool running the blocking invoice logic off the event loop, sized by MAX_WORKERS like the CLI run
+EXECUTOR = ThreadPoolExecutor(max_workers=invoices.ConfigManager().max_workers)
+
+# Maximum number of seconds to wait for a single order before reporting it as failed
+ORDER_TIMEOUT = 120
+
+# Build the shared API handlers, load the CSV mappings and resolve the shipping products once, before the first request arrives
+@app.before_serving
+async def warm_up_invoices():
+    invoice_processor = invoices.get_invoice_processor()
+    # Results are returned per request, so the CLI run summary is not kept for the lifetime of the server
+    invoice_processor.track_summary = False
+    invoice_processor.preload()
+    logger.info("Invoice processor initialized.")
+
+# Create the invoice for a single order in-process and build its result entry
+def _run_invoice(order_id):
+    try:
+        logger.debug("Processing order ID: %s", order_id)
+
+        # Run the invoice logic from invoices.py with the order ID
+        output = invoices.process_order(str(order_id))
+
+        if output["status"] == "success":
+            logger.info("Invoice created successfully for order ID %s: %s", order_id, output['output'])
+        elif output["status"] in ("already_invoiced", "in_progress"):
+            logger.info("Skipped order ID %s: %s", order_id, output['output'])
+        else:
+            logger.error("Failed to create invoice for order ID %s: %s", order_id, output['error'])
+        return {"order_id": order_id, **output}
+    except Exception as e:
+        logger.error("Unexpected error for order ID %s: %s", order_id, e)
+        return {"order_id": order_id, "status": "failed", "error": str(e)}
+
+# Run _run_invoice on the thread pool, failing the order instead of waiting forever if it hangs
+async def _run_invoice_with_timeout(order_id):
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(EXECUTOR, _run_invoice, order_id), timeout=ORDER_TIMEOUT)
+    except asyncio.TimeoutError:
+        logger.error("Timed out after %s seconds waiting for order ID %s", ORDER_TIMEOUT, order_id)
+        return {"order_id": order_id, "status": "failed", "error": f"timeout after {ORDER_TIMEOUT} seconds; the invoice may still be created in Rompslomp"}
 
 @app.route('/process_orders', methods=['POST'])
-def process_orders():
+async def process_orders():
     try:
-        data = request.get_json()
-        order_ids = data.get("orders", [])
+        try:
+            data = orjson.loads(await request.get_data(cache=False))
+        except orjson.JSONDecodeError:
+            logger.error("Invalid JSON body received.")
+            return jsonify({"status": "error", "message": "Invalid JSON body"}), 400
+        order_ids = data.get("orders", []) if isinstance(data, dict) else None
 
         # Validate that we received a list of order IDs
         if not isinstance(order_ids, list) or not order_ids:
-            logging.error("Invalid or empty orders list received.")
+            logger.error("Invalid or empty orders list received.")
             return jsonify({"status": "error", "message": "Invalid or empty orders list"}), 400
 
-        # Loop through each order ID and process it
-        results = []
+        # Reject order IDs that are not strings or integers before doing any work
+        if any(isinstance(order_id, bool) or not isinstance(order_id, (str, int)) for order_id in order_ids):
+            logger.error("Invalid order ID received.")
+            return jsonify({"status": "error", "message": "Order IDs must be strings or integers"}), 400
+
+        # Group duplicate order IDs so every distinct order is only processed once
+        occurrences = {}
         for order_id in order_ids:
-            try:
-                logging.info(f"Processing order ID: {order_id}")
-
-                # Run the invoices.py script with the order ID
-                result = subprocess.run(
-                    ["python3", INVOICES_SCRIPT_PATH, str(order_id)],
-                    capture_output=True,
-                    text=True,
-                    check=True
-                )
-
-                logging.info(f"Invoice created successfully for order ID {order_id}: {result.stdout}")
-                results.append({"order_id": order_id, "status": "success", "output": result.stdout})
-            except subprocess.CalledProcessError as e:
-                logging.error(f"Failed to create invoice for order ID {order_id}: {e.stderr}")
-                results.append({"order_id": order_id, "status": "failed", "error": e.stderr})
-            except Exception as e:
-                logging.error(f"Unexpected error for order ID {order_id}: {str(e)}")
-                results.append({"order_id": order_id, "status": "failed", "error": str(e)})
-
-        return jsonify({"status": "completed", "results": results}), 200
+            occurrences.setdefault(str(order_id), []).append(order_id)
+
+        # Process all distinct order IDs concurrently without blocking the event loop
+        tasks = [_run_invoice_with_timeout(order_id) for order_id in occurrences]
+
+        # Stream each result as newline-delimited JSON as soon as its order completes, once per requested ID
+        async def generate_results():
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                for order_id in occurrences[result["order_id"]]:
+                    yield orjson.dumps({**result, "order_id": order_id}) + b"\n"
+
+        return Response(generate_results(), mimetype="application/x-ndjson"), 200
 
+    except RequestEntityTooLarge:
+        logger.error("Request body exceeds the maximum allowed size.")
+        return jsonify({"status": "error", "message": "Request body too large"}), 413
     except Exception as e:
-        logging.error(f"Unexpected error in /process_orders endpoint: {str(e)}")
+        logger.error("Unexpected error in /process_orders endpoint: %s", e)
         return jsonify({"status": "error", "message": str(e)}), 500
 
+# Development server only; in production serve the app with Hypercorn using a single worker process:
+#   hypercorn -w 1 -b 0.0.0.0:1234 backend_server:app
+# Orders already run concurrently on EXECUTOR. Contact locks and the processed orders checkpoint are per process,
+# so several workers could create duplicate contacts or invoices.
 if __name__ == "__main__":
-    app.run(host='0.0.0.0', port=1234, debug=True)
+    app.run(host='0.0.0.0', port=1234, debug=False)
@@ -9,22 +9,37 @@ chrome.runtime.onMessage.addListener((request, sender, sendResponse) => {
             },
             body: JSON.stringify({ orders: request.orders })
         })
-        .then(response => {
-            console.log('Response received from Flask server:', response);
-            if (response.ok) {
-                return response.json();
-            } else {
+        .then(async response => {
+            console.log('Response received from backend server:', response);
+            if (!response.ok) {
                 throw new Error('Server responded with status ' + response.status);
             }
-        })
-        .then(data => {
-            console.log('Data received from Flask server:', data);
-            if (data.status === 'completed') {
-                sendResponse({ status: 'success', results: data.results });
-            } else {
-                sendResponse({ status: 'error', message: data.message });
+
+            // Results are streamed as newline-delimited JSON, one line per order, as each order completes
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            const results = [];
+            let buffer = '';
+            while (true) {
+                const { done, value } = await reader.read();
+                buffer += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffer.split('\n');
+                buffer = done ? '' : lines.pop();
+                for (const line of lines) {
+                    if (line.trim()) {
+                        const result = JSON.parse(line);
+                        console.log('Result received from backend server:', result);
+                        results.push(result);
+                    }
+                }
+                if (done) {
+                    return results;
+                }
             }
         })
+        .then(results => {
+            sendResponse({ status: 'success', results: results });
+        })
         .catch(error => {
             console.error('Error communicating with server:', error);
             sendResponse({ status: 'error', message: 'Failed to communicate with the server.' });
@@ -1,42 +1,67 @@
-import pandas as pd
+import csv
 import requests
+from requests.adapters import HTTPAdapter
 import logging
-import json
+import orjson
 import time
 import sys
-from datetime import datetime, timedelta
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from datetime import date, timedelta
+from dataclasses import dataclass
 import os
 import math
+import functools
+import itertools
+from collections import OrderedDict, deque
 from dotenv import load_dotenv
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from tenacity import retry, Retrying, stop_after_attempt, wait_exponential_jitter, retry_if_exception
 import diskcache as dc
-import random
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Configure logging; set LOG_LEVEL=WARNING in production to leave out the per-order INFO lines
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+log_level = getattr(logging, LOG_LEVEL, None)
+logging.basicConfig(level=log_level if isinstance(log_level, int) else logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+if not isinstance(log_level, int):
+    logging.warning("Unknown LOG_LEVEL %r, using INFO instead.", LOG_LEVEL)
 
 DEBUG = True
 
-# List of EU countries
-EU_COUNTRIES = [
+# Set of EU countries, for constant-time membership checks
+EU_COUNTRIES = frozenset({
     "AT", "BE", "BG", "CY", "CZ", "DE", "DK", "EE", "ES", "FI", "FR", "GR", "HR", "HU", "IE", "IT", "LT", "LU", "LV", "MT", "PL", "PT", "RO", "SE", "SI", "SK", "NL"
-]
+})
+
+# Invoice template IDs per shipping region
+TEMPLATE_IDS = {
+    "NL": 217484825,
+    "EU": 816357573,
+    "OTHER": 911144380
+}
+
+# Directory containing this script; data files and the cache are resolved against it rather than the working directory
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+VAT_MAPPING_PATH = os.path.join(BASE_DIR, 'vat_mapping.csv')
+SHIPPING_MAPPING_PATH = os.path.join(BASE_DIR, 'shipping_mapping.csv')
+# Checkpoint of invoiced order IDs, one per line, so a rerun skips orders that were already invoiced
+PROCESSED_ORDERS_PATH = os.path.join(BASE_DIR, '.processed_orders')
 
 # Initialize persistent cache
-cache = dc.Cache('./cache')
+cache = dc.Cache(os.path.join(BASE_DIR, 'cache'))
 
-def log_debug(message):
+def log_debug(message, *args):
     """
     Logs debug messages if DEBUG is set to True.
 
     Args:
-        message (str): The message to log.
+        message (str): The message to log, with %-style placeholders for args.
+        *args: The values for the placeholders, only formatted if debug logging is enabled.
     """
     if DEBUG:
-        logging.debug(message)
+        logging.debug(message, *args)
 
 # Utility function to round up to the nearest 5 or 10 cents
 def round_up_to_nearest_5_or_10_cents(amount):
@@ -51,19 +76,220 @@ def round_up_to_nearest_5_or_10_cents(amount):
     """
     return math.ceil(amount * 20) / 20.0
 
+# Raised when an API request still fails with a transient error after its retries
+class TransientAPIError(Exception):
+    """
+    An API request failed with an error that may succeed when the order is processed again later.
+    """
+
+# Utility function to split a sequence into chunks, like itertools.batched on Python 3.12+
+def batched(iterable, size):
+    """
+    Yields successive chunks of at most size items from the iterable.
+
+    Args:
+        iterable (iterable): The items to split.
+        size (int): The maximum number of items per chunk.
+
+    Yields:
+        tuple: The next chunk of items.
+    """
+    iterator = iter(iterable)
+    while chunk := tuple(itertools.islice(iterator, size)):
+        yield chunk
+
 # Centralized error handling function
-def handle_request_error(e, response=None):
+def handle_request_error(e, response=None, allow_transient=True):
     """
     Handles request errors by logging relevant information.
 
     Args:
         e (Exception): The exception that was raised.
         response (requests.Response, optional): The response object, if available.
+        allow_transient (bool): Whether a transient error may be raised so the order is retried. Pass False for
+            requests whose failure must never cause the order to be processed again, such as creating the invoice.
+
+    Raises:
+        TransientAPIError: If the error is transient, so the order can be retried instead of failing permanently.
     """
-    logging.error(f"Request failed: {e}")
+    logging.error("Request failed: %s", e)
     if response is not None:
-        logging.error(f"Response status code: {response.status_code}")
-        logging.error(f"Response content: {response.text}")
+        logging.error("Response status code: %s", response.status_code)
+        logging.error("Response content: %s", response.text)
+    if allow_transient and is_retryable_error(e):
+        raise TransientAPIError(str(e)) from e
+
+# Retry condition for API requests
+def is_retryable_error(e):
+    """
+    Determines whether a failed API request should be retried.
+
+    Reads are retried on timeouts, rate limits and server errors. Writes are only retried when the request was certainly
+    not processed (rate limited, request timeout or no connection made), since repeating a write that may have been
+    processed could create a duplicate contact or invoice.
+
+    Args:
+        e (Exception): The exception that was raised.
+
+    Returns:
+        bool: True if the request can safely be sent again, False otherwise.
+    """
+    if not isinstance(e, requests.RequestException):
+        return False
+    is_read = e.request is not None and e.request.method == 'GET'
+    if e.response is not None:
+        # Other 4xx errors will fail again, so they are not retried
+        if e.response.status_code in (408, 429):
+            return True
+        return is_read and e.response.status_code >= 500
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(e, (requests.exceptions.Timeout, requests.exceptions.ConnectionError)):
+        return is_read
+    return False
+
+# Short exponential backoff with jitter, so transient errors are retried without stalling the workers
+backoff_wait = wait_exponential_jitter(initial=0.1, max=2.0)
+
+# Longest Retry-After delay, in seconds, that is honored before falling back to the backoff
+MAX_RETRY_AFTER = 60
+
+# Seconds to wait for an API connection or response, so a stalled request cannot hold a worker indefinitely
+REQUEST_TIMEOUT = 30
+
+# Times an order that failed with a transient error is processed again before it counts as failed
+MAX_ORDER_RETRIES = 2
+
+# Threads shared by all orders for the Rompslomp lookups made while building an invoice
+LOOKUP_WORKERS = 16
+
+def wait_for_retry(retry_state):
+    """
+    Determines how long to wait before retrying a request, honoring the server's Retry-After header when present.
+
+    Args:
+        retry_state (tenacity.RetryCallState): The state of the call being retried.
+
+    Returns:
+        float: The number of seconds to wait.
+    """
+    response = getattr(retry_state.outcome.exception(), 'response', None)
+    retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+    if retry_after.isdigit():
+        return min(float(retry_after), MAX_RETRY_AFTER)
+    return backoff_wait(retry_state)
+
+# Retry policy shared by all API requests; the last error is re-raised once the attempts are used up
+API_RETRY_POLICY = {
+    'stop': stop_after_attempt(4),
+    'wait': wait_for_retry,
+    'retry': retry_if_exception(is_retryable_error),
+    'reraise': True,
+}
+retry_api = retry(**API_RETRY_POLICY)
+
+# Shared HTTP session setup for the API handlers
+def build_session(pool_maxsize, headers=None, auth=None):
+    """
+    Creates a requests session that keeps connections alive and reuses them across requests and orders.
+
+    Retries are left to retry_api, so the adapter itself does not retry.
+
+    Args:
+        pool_maxsize (int): The maximum number of connections kept open per host.
+        headers (dict, optional): Headers sent with every request.
+        auth (tuple, optional): Basic authentication credentials sent with every request.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=16, pool_maxsize=pool_maxsize, max_retries=0)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    if headers:
+        session.headers.update(headers)
+    session.auth = auth
+    return session
+
+# Latency tracking for hedged requests
+class LatencyTracker:
+    """
+    Keeps the most recent request latencies to estimate the 95th percentile latency.
+    """
+    def __init__(self, default, window=200, min_samples=20):
+        self.default = default
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        """
+        Records the latency of a completed request.
+
+        Args:
+            seconds (float): The latency of the request in seconds.
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        """
+        Estimates the 95th percentile latency.
+
+        Returns:
+            float: The estimated latency in seconds, or the default until enough requests have been recorded.
+        """
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default
+            samples = sorted(self._samples)
+        return samples[int(len(samples) * 0.95)]
+
+# Pool for hedged requests, separate from the order and lookup pools so a hedge never waits on its own caller
+hedge_executor = ThreadPoolExecutor(max_workers=64)
+
+# Most hedge requests in flight at once; a slow request that finds no free slot simply waits for its first attempt
+MAX_OUTSTANDING_HEDGES = 4
+hedge_slots = threading.BoundedSemaphore(MAX_OUTSTANDING_HEDGES)
+
+# Seconds after a rate limit response during which no hedge requests are sent
+HEDGE_PAUSE_AFTER_RATE_LIMIT = 60
+
+def hedged_call(call, hedge_after):
+    """
+    Runs a read-only request, starting a second identical request if the first one takes longer than hedge_after.
+
+    The first successful response is returned; the slower request is left to finish in the background and discarded.
+    At most MAX_OUTSTANDING_HEDGES hedge requests run at once, so hedging cannot multiply the load on a slow API.
+    Only use this for requests that are safe to repeat.
+
+    Args:
+        call (callable): Sends the request and returns the response.
+        hedge_after (float): Seconds to wait for the first request before hedging.
+
+    Returns:
+        The result of the first request that succeeds.
+    """
+    first = hedge_executor.submit(call)
+    done, _ = wait([first], timeout=hedge_after)
+    if done:
+        return first.result()
+
+    if not hedge_slots.acquire(blocking=False):
+        return first.result()
+
+    logging.info("Request slower than %.2fs, sending a hedged request.", hedge_after)
+    hedge = hedge_executor.submit(call)
+    # The slot is held until the hedge finishes, even if the first request wins
+    hedge.add_done_callback(lambda _: hedge_slots.release())
+    error = None
+    for future in as_completed([first, hedge]):
+        try:
+            return future.result()
+        except Exception as e:
+            error = e
+    raise error
 
 # Data validation utility function
 def validate_order_data(order):
@@ -79,7 +305,7 @@ def validate_order_data(order):
     required_fields = ['billing', 'line_items', 'id', 'date_created', 'shipping']
     for field in required_fields:
         if field not in order:
-            logging.error(f"Missing required field in order: {field}")
+            logging.error("Missing required field in order: %s", field)
             return False
     if not order['billing'].get('email'):
         logging.error("Missing email in billing information")
@@ -87,6 +313,7 @@ def validate_order_data(order):
     return True
 
 # Get template ID based on the shipping country code
+@functools.lru_cache(maxsize=256)
 def get_template_id(country_code):
     """
     Determines the appropriate template ID for the invoice based on the shipping country.
@@ -97,11 +324,6 @@ def get_template_id(country_code):
     Returns:
         int: The template ID for the invoice.
     """
-    TEMPLATE_IDS = {
-        "NL": 217484825,
-        "EU": 816357573,
-        "OTHER": 911144380
-    }
     if country_code == "NL":
         return TEMPLATE_IDS["NL"]
     elif country_code in EU_COUNTRIES:
@@ -109,6 +331,105 @@ def get_template_id(country_code):
     else:
         return TEMPLATE_IDS["OTHER"]
 
+# Product details resolved from Rompslomp
+@dataclass(slots=True, frozen=True)
+class ResolvedProduct:
+    """
+    The details of a Rompslomp product that are used on invoice lines.
+    """
+    id: int
+    description: str | None
+    price_per_unit: float
+    price_with_vat: float
+    vat_rate: float
+    vat_type_id: int | None
+    account_id: int | None
+    account_path: str | None
+
+# In-memory layer on top of the persistent cache
+class TieredCache:
+    """
+    Keeps entries read from or written to the persistent disk cache in a bounded in-memory LRU, so repeated lookups skip SQLite.
+    """
+    def __init__(self, disk_cache, max_entries=10000):
+        self.disk_cache = disk_cache
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value, expire_time):
+        # Store an entry in memory, evicting the least recently used entries beyond max_entries
+        with self._lock:
+            self._entries[key] = (value, expire_time)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key, default=None):
+        """
+        Fetches a value from memory, falling back to the disk cache.
+
+        Args:
+            key (str): The cache key.
+            default: The value to return if the key is not cached.
+
+        Returns:
+            The cached value, or default if the key is not cached or has expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expire_time = entry
+                if expire_time is None or expire_time > time.time():
+                    self._entries.move_to_end(key)
+                    return value
+                del self._entries[key]
+
+        value, expire_time = self.disk_cache.get(key, default=None, expire_time=True)
+        if value is None:
+            return default
+        self._remember(key, value, expire_time)
+        return value
+
+    def set(self, key, value, expire=None):
+        """
+        Stores a value in both memory and the disk cache.
+
+        Args:
+            key (str): The cache key.
+            value: The value to store.
+            expire (int, optional): Seconds until the value expires.
+        """
+        self.disk_cache.set(key, value, expire=expire)
+        self._remember(key, value, time.time() + expire if expire else None)
+
+    def delete(self, key):
+        """
+        Removes a value from both memory and the disk cache.
+
+        Args:
+            key (str): The cache key.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+        self.disk_cache.delete(key)
+
+    def warm_up(self, prefixes):
+        """
+        Loads the disk cache entries whose keys start with one of the given prefixes into memory.
+
+        Args:
+            prefixes (tuple): The key prefixes to load.
+        """
+        for key in self.disk_cache.iterkeys():
+            if isinstance(key, str) and key.startswith(prefixes):
+                value, expire_time = self.disk_cache.get(key, default=None, expire_time=True)
+                if value is not None:
+                    self._remember(key, value, expire_time)
+
+# Initialize the in-memory layer used for contact and product lookups
+lookup_cache = TieredCache(cache)
+
 # Configuration Manager
 class ConfigManager:
     """
@@ -127,6 +448,8 @@ class ConfigManager:
         self.rompslomp_contacts_url = f"{self.rompslomp_base_url}{os.getenv('ROMPSLOMP_CONTACTS_ENDPOINT')}"
         self.rompslomp_products_url = f"{self.rompslomp_base_url}{os.getenv('ROMPSLOMP_PRODUCTS_ENDPOINT')}"
         self.rompslomp_invoices_url = f"{self.rompslomp_base_url}{os.getenv('ROMPSLOMP_INVOICES_ENDPOINT')}"
+        # Number of orders processed at the same time; tune to stay within the Dokan and Rompslomp rate limits
+        self.max_workers = int(os.getenv("MAX_WORKERS", "8"))
 
 # Data Loader for CSV Loading and Caching
 class DataLoader:
@@ -137,15 +460,40 @@ class DataLoader:
         self.vat_mapping_dict = None
         self.shipping_mapping_dict = None
 
+    @staticmethod
+    def load_cached_csv(path, build):
+        """
+        Loads a dictionary built from a CSV file, reusing the prepared dictionary from the persistent cache until the file changes.
+
+        Args:
+            path (str): The path to the CSV file.
+            build (callable): Builds the dictionary from a csv.DictReader over the file.
+
+        Returns:
+            dict: The dictionary built from the CSV file.
+        """
+        stat = os.stat(path)
+        cache_key = f'csv_{os.path.basename(path)}_{stat.st_mtime_ns}_{stat.st_size}'
+        mapping = cache.get(cache_key)
+        if mapping is None:
+            with open(path, newline='') as f:
+                mapping = build(csv.DictReader(f))
+            cache.set(cache_key, mapping, expire=30 * 24 * 3600)  # Keys change with the file, so old versions simply expire
+        return mapping
+
     def load_vat_mapping(self):
         """
         Loads the VAT mapping from a CSV file.
 
         Returns:
-            dict: A dictionary containing VAT mapping data.
+            dict: A dictionary mapping country codes to (VAT type ID, VAT rate) tuples.
         """
         if self.vat_mapping_dict is None:
-            self.vat_mapping_dict = pd.read_csv('vat_mapping.csv').set_index('country_code').to_dict(orient='index')
+            # Stored as ready-to-return (VAT type ID, VAT rate) tuples, cast once here rather than on every lookup
+            self.vat_mapping_dict = self.load_cached_csv(VAT_MAPPING_PATH, lambda rows: {
+                row['country_code']: (int(row['vat_type_id']), float(row['vat_rate']))
+                for row in rows
+            })
         return self.vat_mapping_dict
 
     def load_shipping_mapping(self):
@@ -156,7 +504,11 @@ class DataLoader:
             dict: A dictionary containing shipping mapping data.
         """
         if self.shipping_mapping_dict is None:
-            self.shipping_mapping_dict = pd.read_csv('shipping_mapping.csv').set_index(['Dokan_method', 'price']).to_dict(orient='index')
+            # Keyed by (method title, price) to match the lookup in create_concept_invoice
+            self.shipping_mapping_dict = self.load_cached_csv(SHIPPING_MAPPING_PATH, lambda rows: {
+                (row['Dokan_method'], float(row['price'])): {'SKU': row['SKU']}
+                for row in rows
+            })
         return self.shipping_mapping_dict
 
 # VAT Handling Utility Class
@@ -177,13 +529,7 @@ class VATHandler:
         Returns:
             tuple: A tuple containing the VAT type ID and VAT rate.
         """
-        vat_mapping_dict = self.data_loader.load_vat_mapping()
-        vat_info = vat_mapping_dict.get(country_code)
-        if vat_info:
-            vat_type_id = int(vat_info['vat_type_id'])  # Convert to standard int
-            vat_rate = float(vat_info['vat_rate'])  # Convert to standard float
-            return vat_type_id, vat_rate
-        return None, None
+        return self.data_loader.load_vat_mapping().get(country_code, (None, None))
 
     def determine_vat_for_line_item(self, shipping_country, is_eu_country, total_including_vat, vat_type_id, price_per_unit):
         """
@@ -218,33 +564,64 @@ class DokanAPI:
     def __init__(self, config):
         self.base_url = config.dokan_base_url
         self.auth = config.dokan_auth
+        # One pooled connection per concurrent order worker, plus one for the thread paging through the orders
+        self.session = build_session(config.max_workers + 1, auth=self.auth)
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
-    def get_last_processing_order(self):
+    def get_processing_orders_page(self, page, per_page=100):
         """
-        Fetches the last processing orders from Dokan.
+        Fetches a single page of processing orders from Dokan, oldest order ID first.
+
+        Args:
+            page (int): The page number, starting at 1.
+            per_page (int): The number of orders per page.
 
         Returns:
-            list: A list of processing orders.
+            list: The processing orders on the page, or None if the page could not be fetched.
         """
         try:
-            if 'last_processing_orders' in cache:
-                logging.info("Fetching orders from cache.")
-                return cache['last_processing_orders']
-
-            params = {'status': 'processing', 'orderby': 'date', 'order': 'desc', 'per_page': 100}
-            response = requests.get(self.base_url, auth=self.auth, params=params)
-            self.handle_response(response)
-            orders = response.json()
-            cache.set('last_processing_orders', orders, expire=3600)  # Cache for 1 hour
-            return orders
+            params = {'status': 'processing', 'orderby': 'id', 'order': 'asc', 'per_page': per_page, 'page': page}
+            response = self.send_request('GET', self.base_url, params=params)
+            return orjson.loads(response.content)
         except requests.RequestException as e:
             handle_request_error(e)
+            return None
+
+    def iter_processing_orders(self, per_page=100):
+        """
+        Yields all processing orders from Dokan, fetching them one page at a time.
+
+        The listing is a live work queue, so pages are always fetched fresh rather than cached. Orders are paged by
+        ascending ID, so orders placed during the run are added after the pages already read instead of shifting them.
+        An order that is yielded twice, for example because it briefly left the processing status, is skipped.
+
+        Args:
+            per_page (int): The number of orders fetched per request.
+
+        Yields:
+            dict: The next processing order.
+        """
+        seen_order_ids = set()
+        page = 1
+        while True:
+            logging.info("Fetching processing orders from Dokan, page %s...", page)
+            try:
+                orders = self.get_processing_orders_page(page, per_page)
+            except TransientAPIError:
+                return
+            if not orders:
+                return
+
+            for order in orders:
+                if order['id'] not in seen_order_ids:
+                    seen_order_ids.add(order['id'])
+                    yield order
+            if len(orders) < per_page:
+                return
+            page += 1
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def get_order_by_id(self, order_id):
         """
-        Fetches a specific order by ID from Dokan.
+        Fetches a specific order by ID from Dokan, using caching for efficiency.
 
         Args:
             order_id (str): The ID of the order to fetch.
@@ -254,20 +631,37 @@ class DokanAPI:
         """
         try:
             cache_key = f'order_{order_id}'
-            if cache_key in cache:
-                logging.info(f"Fetching order {order_id} from cache.")
-                return cache[cache_key]
+            order = lookup_cache.get(cache_key)
+            if order is not None:
+                logging.info("Fetching order %s from cache.", order_id)
+                return order
 
             url = f"{self.base_url}/{order_id}"
-            response = requests.get(url, auth=self.auth)
-            self.handle_response(response)
-            order = response.json()
-            cache.set(cache_key, order, expire=3600)  # Cache for 1 hour
+            response = self.send_request('GET', url)
+            order = orjson.loads(response.content)
+            lookup_cache.set(cache_key, order, expire=600)  # Cache for 10 minutes
             return order
         except requests.RequestException as e:
             handle_request_error(e)
             return None
 
+    @retry_api
+    def send_request(self, method, url, **kwargs):
+        """
+        Sends an API request, retrying timeouts, rate limits and transient server errors.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            **kwargs: Additional arguments passed to requests.Session.request.
+
+        Returns:
+            requests.Response: The response object.
+        """
+        response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        self.handle_response(response)
+        return response
+
     def handle_response(self, response):
         """
         Handles the response from an API request, including error handling for rate limits and server errors.
@@ -277,10 +671,9 @@ class DokanAPI:
         """
         if response.status_code == 429:  # Too many requests
             logging.warning("Rate limit hit. Retrying after delay...")
-            time.sleep(10)
             raise requests.exceptions.RequestException("Rate limit hit", response=response)
         elif 500 <= response.status_code < 600:  # Server errors
-            logging.error(f"Server error: {response.status_code}")
+            logging.error("Server error: %s", response.status_code)
             raise requests.exceptions.RequestException("Server error", response=response)
         elif response.status_code == 404:
             logging.error("Resource not found")
@@ -299,8 +692,12 @@ class RompslompAPI:
         self.contacts_url = config.rompslomp_contacts_url
         self.products_url = config.rompslomp_products_url
         self.invoices_url = config.rompslomp_invoices_url
+        # Pooled connections for every concurrent order worker, the lookups they fan out and the outstanding hedges
+        self.session = build_session(config.max_workers + LOOKUP_WORKERS + MAX_OUTSTANDING_HEDGES, headers=self.headers)
+        # Latencies of searches, used to decide when a slow search is hedged
+        self.latency = LatencyTracker(default=2.0)
+        self._hedging_paused_until = 0
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def get_contact_id(self, email):
         """
         Fetches the contact ID from Rompslomp by email address, using caching for efficiency.
@@ -312,86 +709,179 @@ class RompslompAPI:
             int: The contact ID if found, otherwise None.
         """
         cache_key = f'contact_{email}'
-        if cache_key in cache:
-            logging.info(f"Fetching contact ID for {email} from cache.")
-            return cache[cache_key]
+        contact_id = lookup_cache.get(cache_key)
+        if contact_id is not None:
+            logging.info("Fetching contact ID for %s from cache.", email)
+            return contact_id
 
         try:
             params = {'search[contact_person_email_address]': email}
-            response = requests.get(self.contacts_url, headers=self.headers, params=params)
-            self.handle_response(response)
-            contacts = response.json()
-            log_debug(f"Searching for contact with email: {email}")
-            log_debug(f"Rompslomp contact search response: {contacts}")
+            response = self.send_request('GET', self.contacts_url, params=params)
+            contacts = orjson.loads(response.content)
+            log_debug("Searching for contact with email: %s", email)
+            log_debug("Rompslomp contact search response: %s", contacts)
             if 'contacts' in contacts and isinstance(contacts['contacts'], list) and contacts['contacts']:
                 for contact in contacts['contacts']:
                     if contact.get('contact_person_email_address') == email:
                         contact_id = contact['id']
-                        logging.info(f"Contact found: {contact['name']} with contact ID: {contact_id}")
-                        cache.set(cache_key, contact_id, expire=3600)  # Cache for 1 hour
+                        logging.info("Contact found: %s with contact ID: %s", contact['name'], contact_id)
+                        lookup_cache.set(cache_key, contact_id, expire=3600)  # Cache for 1 hour
                         return contact_id
             return None
         except requests.RequestException as e:
             handle_request_error(e)
             return None
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def get_product_id_by_sku(self, sku):
         """
         Fetches the product ID from Rompslomp by SKU, using caching for efficiency.
 
+        If the SKU itself is not found, shortened SKUs (with the last '-' part removed) are tried as well.
+        All candidates are searched with a single request; an exact match is always preferred, then the most specific shortened SKU.
+
         Args:
             sku (str): The SKU of the product.
 
         Returns:
-            tuple: A tuple containing product details such as ID, description, price, VAT rate, etc., or None if the product is not found.
+            ResolvedProduct: The product details, or None if the product is not found.
         """
-        cache_key = f'product_{sku}'
-        if cache_key in cache:
-            logging.info(f"Fetching product ID for SKU {sku} from cache.")
-            return cache[cache_key]
+        if not sku:
+            return None
+
+        candidate_skus = [sku, *self.shortened_skus(sku)]
+        found = self.get_products_by_skus(candidate_skus)
+        if found.get(sku) is not None:
+            return found[sku]
+        return self.pick_fallback_product(sku, candidate_skus[1:], found)
+
+    def get_fallback_product(self, sku):
+        """
+        Fetches the product of the most specific shortened SKU, for a SKU that has no exact match in Rompslomp.
+
+        Fallbacks are cached separately from exact matches, so the caller's exact search still finds a product created later.
+
+        Args:
+            sku (str): The SKU of the product, already known to have no exact match.
+
+        Returns:
+            ResolvedProduct: The product details, or None if no shortened SKU is found either.
+        """
+        if not sku:
+            return None
+
+        product_data = lookup_cache.get(f'resolved_fallback_{sku}')
+        if product_data is not None:
+            logging.info("Fetching fallback product for SKU %s from cache.", sku)
+            return product_data
+
+        candidate_skus = self.shortened_skus(sku)
+        found = self.get_products_by_skus(candidate_skus) if candidate_skus else {}
+        return self.pick_fallback_product(sku, candidate_skus, found)
+
+    @staticmethod
+    def shortened_skus(sku):
+        """
+        Lists the shortened versions of a SKU, removing one '-' part at a time.
+
+        Args:
+            sku (str): The SKU of the product.
+
+        Returns:
+            list: The shortened SKUs, most specific first.
+        """
+        candidate_skus = []
+        while '-' in sku:
+            sku = sku.rsplit('-', 1)[0]
+            candidate_skus.append(sku)
+        return candidate_skus
+
+    @staticmethod
+    def pick_fallback_product(sku, candidate_skus, found):
+        """
+        Picks the product of the most specific shortened SKU that was found and caches it as the fallback for the SKU.
+
+        Args:
+            sku (str): The SKU of the product.
+            candidate_skus (list): The shortened SKUs, most specific first.
+            found (dict): The products found, by SKU.
+
+        Returns:
+            ResolvedProduct: The product details, or None if none of the shortened SKUs was found.
+        """
+        for candidate_sku in candidate_skus:
+            product_data = found.get(candidate_sku)
+            if product_data is not None:
+                logging.info("Using product for modified SKU %s for SKU %s", candidate_sku, sku)
+                lookup_cache.set(f'resolved_fallback_{sku}', product_data, expire=3600)  # Cache for 1 hour
+                return product_data
+        logging.info("No product found for SKU %s", sku)
+        return None
+
+    def get_products_by_skus(self, skus):
+        """
+        Fetches the products for several SKUs from Rompslomp with a single search request, using caching for efficiency.
+
+        Only exact product code matches are returned and cached; SKUs that are not found can be looked up with get_fallback_product, which tries shortened SKUs.
+
+        Args:
+            skus (list): The SKUs of the products.
+
+        Returns:
+            dict: A dictionary mapping each SKU that was found to its ResolvedProduct.
+        """
+        found = {}
+        missing = []
+        for sku in dict.fromkeys(sku for sku in skus if sku):
+            product_data = lookup_cache.get(f'resolved_product_{sku}')
+            if product_data is not None:
+                found[sku] = product_data
+            else:
+                missing.append(sku)
+        if not missing:
+            return found
 
         try:
-            params = {'search[product_codes][]': sku}
-            response = requests.get(self.products_url, headers=self.headers, params=params)
-            self.handle_response(response)
-            products = response.json()
-            log_debug(f"Searching for product with product_code: {sku}")
-            log_debug(f"Rompslomp product search response: {products}")
-            if 'products' in products and isinstance(products['products'], list) and products['products']:
+            params = [('search[product_codes][]', sku) for sku in missing]
+            response = self.send_request('GET', self.products_url, params=params)
+            products = orjson.loads(response.content)
+            log_debug("Searching for products with product_codes: %s", missing)
+            log_debug("Rompslomp product search response: %s", products)
+            if 'products' in products and isinstance(products['products'], list):
                 for product in products['products']:
-                    if product.get('invoice_line', {}).get('product_code') == sku:
-                        logging.info(f"Product found with product_code (SKU): {sku} and product ID: {product['id']}")
-                        price_per_unit = product['invoice_line'].get('price_per_unit', 0)
-                        price_with_vat = product['invoice_line'].get('price_with_vat', 0)
-                        vat_rate = product['invoice_line'].get('vat_rate', '0.21')
-                        vat_type_id = product['invoice_line'].get('vat_type_id', None)
-                        account_id = product['invoice_line'].get('account_id', None)
-                        account_path = product['invoice_line'].get('account_path', None)
-
-                        product_data = (
-                            product['id'],
-                            product['invoice_line'].get('description'),
-                            price_per_unit,
-                            price_with_vat,
-                            vat_rate,
-                            vat_type_id,
-                            account_id,
-                            account_path
-                        )
-                        cache.set(cache_key, product_data, expire=3600)  # Cache for 1 hour
-                        return product_data
-            # If no product found, try removing the last '-' and retry
-            if '-' in sku:
-                new_sku = sku.rsplit('-', 1)[0]
-                logging.info(f"Retrying with modified SKU: {new_sku}")
-                return self.get_product_id_by_sku(new_sku)
-            return None, None, None, None, None, None, None, None
+                    sku = product.get('invoice_line', {}).get('product_code')
+                    if sku in missing and sku not in found:
+                        logging.info("Product found with product_code (SKU): %s and product ID: %s", sku, product['id'])
+                        found[sku] = self.build_product_data(product)
+                        lookup_cache.set(f'resolved_product_{sku}', found[sku], expire=3600)  # Cache for 1 hour
+            return found
         except requests.RequestException as e:
             handle_request_error(e)
-            return None, None, None, None, None, None, None, None
+            return found
+
+    @staticmethod
+    def build_product_data(product):
+        """
+        Extracts the product details used on invoice lines from a Rompslomp product.
+
+        Args:
+            product (dict): The product data from the Rompslomp API.
+
+        Returns:
+            ResolvedProduct: The product details.
+        """
+        invoice_line = product['invoice_line']
+        # The API returns amounts as decimal strings, so they are converted once here
+        return ResolvedProduct(
+            id=product['id'],
+            description=invoice_line.get('description'),
+            price_per_unit=float(invoice_line.get('price_per_unit') or 0),
+            price_with_vat=float(invoice_line.get('price_with_vat') or 0),
+            vat_rate=float(invoice_line['vat_rate']) if invoice_line.get('vat_rate') is not None else 0.21,
+            vat_type_id=invoice_line.get('vat_type_id', None),
+            account_id=invoice_line.get('account_id', None),
+            account_path=invoice_line.get('account_path', None)
+        )
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def create_contact(self, contact_data):
         """
         Creates a new contact in Rompslomp.
@@ -403,14 +893,17 @@ class RompslompAPI:
             dict: The response data containing the created contact information, or None if the contact could not be created.
         """
         try:
-            response = requests.post(self.contacts_url, headers=self.headers, data=json.dumps(contact_data))
-            self.handle_response(response)
-            return response.json()
+            response = self.send_request('POST', self.contacts_url, data=orjson.dumps(contact_data))
+            contact = orjson.loads(response.content)
+            if contact and 'contact' in contact and 'id' in contact['contact']:
+                # Cache the new contact so later orders from the same customer skip the search
+                email = contact_data['contact']['contact_person_email_address']
+                lookup_cache.set(f'contact_{email}', contact['contact']['id'], expire=3600)  # Cache for 1 hour
+            return contact
         except requests.RequestException as e:
             handle_request_error(e)
             return None
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def create_invoice(self, invoice_data):
         """
         Creates a new sales invoice in Rompslomp.
@@ -422,29 +915,76 @@ class RompslompAPI:
             dict: The response data containing the created invoice information, or None if the invoice could not be created.
         """
         try:
-            response = requests.post(self.invoices_url, headers=self.headers, json={"sales_invoice": invoice_data})
-            self.handle_response(response)
-            return response.json()
+            response = self.send_request('POST', self.invoices_url, data=orjson.dumps({"sales_invoice": invoice_data}))
+            return orjson.loads(response.content)
         except requests.RequestException as e:
-            handle_request_error(e)
+            # The invoice may have been created despite the error, so the order is never retried automatically
+            logging.error("Creating the invoice for order %s failed; check Rompslomp for a concept invoice before processing it again.",
+                          invoice_data.get('payment_reference'))
+            handle_request_error(e, allow_transient=False)
             return None
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10) + wait_exponential(multiplier=random.uniform(0.5, 1.5)), retry=retry_if_exception(lambda e: isinstance(e, requests.RequestException) and e.response is not None and e.response.status_code in [429, 500, 502, 503]))
     def patch_invoice(self, invoice_id, patch_data):
         """
         Patches an existing sales invoice in Rompslomp.
 
+        Invoices are created with their final price_per_unit values, so this is only needed to correct an invoice afterwards.
+
         Args:
             invoice_id (int): The ID of the invoice to be patched.
             patch_data (dict): The data to patch in the invoice.
         """
         try:
             patch_url = f"{self.invoices_url}/{invoice_id}"
-            response = requests.patch(patch_url, headers=self.headers, json=patch_data)
-            self.handle_response(response)
-            logging.info(f"Invoice {invoice_id} successfully patched with correct price_per_unit values.")
+            self.send_request('PATCH', patch_url, data=orjson.dumps(patch_data))
+            logging.info("Invoice %s successfully patched with correct price_per_unit values.", invoice_id)
         except requests.RequestException as e:
-            handle_request_error(e)
+            handle_request_error(e, allow_transient=False)
+
+    def send_request(self, method, url, **kwargs):
+        """
+        Sends an API request, retrying timeouts, rate limits and transient server errors.
+
+        A slow search is hedged with a second request, but only on its first attempt and not shortly after a rate limit
+        response, so hedges do not add load while Rompslomp is struggling. Writes are never hedged.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            **kwargs: Additional arguments passed to requests.Session.request.
+
+        Returns:
+            requests.Response: The response object.
+        """
+        for attempt in Retrying(**API_RETRY_POLICY):
+            with attempt:
+                if method != 'GET':
+                    response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+                elif attempt.retry_state.attempt_number == 1 and time.monotonic() >= self._hedging_paused_until:
+                    response = hedged_call(lambda: self.timed_request(method, url, **kwargs), self.latency.p95())
+                else:
+                    response = self.timed_request(method, url, **kwargs)
+                if response.status_code == 429:
+                    self._hedging_paused_until = time.monotonic() + HEDGE_PAUSE_AFTER_RATE_LIMIT
+                self.handle_response(response)
+                return response
+
+    def timed_request(self, method, url, **kwargs):
+        """
+        Sends an API request and records its latency.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to send the request to.
+            **kwargs: Additional arguments passed to requests.Session.request.
+
+        Returns:
+            requests.Response: The response object.
+        """
+        start = time.monotonic()
+        response = self.session.request(method, url, timeout=REQUEST_TIMEOUT, **kwargs)
+        self.latency.record(time.monotonic() - start)
+        return response
 
     def handle_response(self, response):
         """
@@ -455,10 +995,9 @@ class RompslompAPI:
         """
         if response.status_code == 429:  # Too many requests
             logging.warning("Rate limit hit. Retrying after delay...")
-            time.sleep(10)
             raise requests.exceptions.RequestException("Rate limit hit", response=response)
         elif 500 <= response.status_code < 600:  # Server errors
-            logging.error(f"Server error: {response.status_code}")
+            logging.error("Server error: %s", response.status_code)
             raise requests.exceptions.RequestException("Server error", response=response)
         elif response.status_code == 404:
             logging.error("Resource not found")
@@ -471,15 +1010,233 @@ class InvoiceProcessor:
     """
     Processes invoices by interacting with Dokan and Rompslomp APIs.
     """
-    def __init__(self, dokan_api, rompslomp_api, vat_handler, data_loader):
+    def __init__(self, dokan_api, rompslomp_api, vat_handler, data_loader, max_workers=8, track_summary=True):
         self.dokan_api = dokan_api
         self.rompslomp_api = rompslomp_api
         self.vat_handler = vat_handler
         self.data_loader = data_loader
+        self.max_workers = max_workers
+        # The run summary below is only kept for CLI runs; a long-running server would grow it without bound
+        self.track_summary = track_summary
         self.success_count = 0
         self.failure_count = 0
         self.failed_orders = []
         self.invoices_with_issues = []
+        # Orders that failed with a transient error, retried last-in first-out so a failing order fails fast
+        self.retry_stack = []
+        self._retry_attempts = {}
+        # Orders invoiced by this or an earlier run
+        self.processed_orders = self.load_processed_orders()
+        # Orders being invoiced right now, so an order sent again before it finishes is not invoiced twice
+        self.in_progress_orders = set()
+        # Guards the counters above, as orders may be processed from several threads
+        self._lock = threading.Lock()
+        # Serializes appends to the checkpoint file, so the slow fsync does not hold up the counters
+        self._checkpoint_lock = threading.Lock()
+        # Fixed set of locks shared by email hash, so contact lookups for one email are serialized without keeping a lock per email
+        self._contact_locks = [threading.Lock() for _ in range(64)]
+        # Shared pool for the independent Rompslomp lookups made while building a single invoice
+        self._lookup_executor = ThreadPoolExecutor(max_workers=LOOKUP_WORKERS)
+        # Products of the shipping mappings, resolved once and refreshed hourly
+        self._shipping_product_index = None
+        self._shipping_product_index_expires = 0
+        self._shipping_product_index_refreshing = False
+        self._shipping_product_index_lock = threading.Lock()
+
+    def _record_success(self):
+        if not self.track_summary:
+            return
+        with self._lock:
+            self.success_count += 1
+
+    def _record_failure(self, order_id):
+        if not self.track_summary:
+            return
+        with self._lock:
+            self.failure_count += 1
+            self.failed_orders.append(order_id)
+
+    @staticmethod
+    def load_processed_orders():
+        """
+        Loads the IDs of the orders invoiced by earlier runs from the checkpoint file.
+
+        Returns:
+            set: The order IDs, as strings.
+        """
+        try:
+            with open(PROCESSED_ORDERS_PATH) as f:
+                return {line.strip() for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _record_processed(self, order_id):
+        # Append to the checkpoint and flush it to disk, so an invoiced order survives a crash of the run
+        with self._lock:
+            self.processed_orders.add(str(order_id))
+        with self._checkpoint_lock:
+            with open(PROCESSED_ORDERS_PATH, 'a') as f:
+                f.write(f"{order_id}\n")
+                f.flush()
+                os.fsync(f.fileno())
+
+    def get_or_create_contact(self, customer):
+        """
+        Finds the Rompslomp contact for a Dokan customer, creating it if it does not exist yet.
+
+        Lookups for the same email address are serialized, so concurrent orders from a new customer create a single contact.
+
+        Args:
+            customer (dict): The billing information from the Dokan order.
+
+        Returns:
+            int: The contact ID, or None if the contact could not be found or created.
+        """
+        email = customer['email']
+        with self._contact_locks[hash(email) % len(self._contact_locks)]:
+            # Check if contact exists in Rompslomp
+            contact_id = self.rompslomp_api.get_contact_id(email)
+            if contact_id:
+                return contact_id
+
+            logging.info("No contact found with email: %s. Creating new contact.", email)
+            contact_data = {
+                "contact": {
+                    "is_individual": True if 'company' not in customer or not customer['company'] else False,
+                    "is_supplier": True if 'company' in customer and customer['company'] else False,
+                    "company_name": customer['company'] if 'company' in customer and customer['company'] else None,
+                    "contact_person_name": f"{customer['first_name']} {customer['last_name']}",
+                    "contact_person_email_address": email,
+                    "address": f"{customer.get('address_1', '')}, {customer.get('address_2', '')}" if customer.get('address_2', '') else customer.get('address_1', ''),
+                    "zipcode": customer.get('postcode', ''),
+                    "city": customer.get('city', ''),
+                    "country_code": customer.get('country', 'NL'),  # Default to NL if country is missing
+                    "phone": customer.get('phone', None)
+                }
+            }
+            contact = self.rompslomp_api.create_contact(contact_data)
+            if contact and 'contact' in contact and 'id' in contact['contact']:
+                contact_id = contact['contact']['id']
+                logging.info("Contact created successfully with ID: %s", contact_id)
+                return contact_id
+
+            logging.error("Unexpected response format: %s", contact)
+            return None
+
+    def resolve_products(self, skus):
+        """
+        Resolves the Rompslomp products for a list of SKUs, finding all exact matches with a single product search.
+
+        SKUs without an exact match fall back to the products of their shortened SKUs, looked up concurrently.
+
+        Args:
+            skus (list): The SKUs to resolve.
+
+        Returns:
+            dict: A dictionary mapping each SKU to its ResolvedProduct, or None if it could not be found.
+        """
+        products = self.rompslomp_api.get_products_by_skus(skus)
+        missing_skus = [sku for sku in dict.fromkeys(skus) if sku not in products]
+        products.update(zip(missing_skus, self._lookup_executor.map(self.rompslomp_api.get_fallback_product, missing_skus)))
+        return products
+
+    def preload(self):
+        """
+        Loads the VAT and shipping mappings and resolves the shipping products up front, so the first orders do not wait for them.
+        """
+        self.data_loader.load_vat_mapping()
+        self.data_loader.load_shipping_mapping()
+        try:
+            self.get_shipping_product_index()
+        except TransientAPIError as e:
+            # The index is built again by the first order that needs it
+            logging.warning("Failed to preload shipping products: %s", e)
+
+    def get_shipping_product_index(self):
+        """
+        Resolves the Rompslomp product of every shipping mapping once, so shipping lines need no lookups per order.
+
+        Only the first build makes the other workers wait. Once an index exists, one thread refreshes it when it expires
+        while the others keep using the old one.
+
+        Returns:
+            dict: A dictionary mapping (method title, price) to the ResolvedProduct of the shipping product.
+        """
+        with self._shipping_product_index_lock:
+            if self._shipping_product_index is None:
+                # Nothing to fall back on yet, so the other workers wait for the first build
+                return self._build_shipping_product_index()
+            if time.time() < self._shipping_product_index_expires or self._shipping_product_index_refreshing:
+                return self._shipping_product_index
+            self._shipping_product_index_refreshing = True
+
+        try:
+            return self._build_shipping_product_index()
+        finally:
+            self._shipping_product_index_refreshing = False
+
+    def _build_shipping_product_index(self):
+        shipping_mapping_dict = self.data_loader.load_shipping_mapping()
+        products = self.resolve_products([row['SKU'] for row in shipping_mapping_dict.values()])
+        index = {
+            key: products[row['SKU']]
+            for key, row in shipping_mapping_dict.items()
+            if products[row['SKU']] is not None
+        }
+
+        # Keep a partial index too, but resolve it again after a few minutes so a product added later is picked up
+        ttl = 3600 if len(index) == len(shipping_mapping_dict) else 300
+        self._shipping_product_index = index
+        self._shipping_product_index_expires = time.time() + ttl
+        return index
+
+    def determine_vat_for_product(self, product, price, shipping_country, is_eu_country):
+        """
+        Determines the VAT type ID, VAT rate and price per unit for a product line.
+
+        Args:
+            product (ResolvedProduct): The Rompslomp product of the line.
+            price (float): The price from the Dokan order line.
+            shipping_country (str): The country code of the shipping address.
+            is_eu_country (bool): Whether the shipping country is in the EU.
+
+        Returns:
+            tuple: A tuple containing the VAT type ID, VAT rate, and price per unit.
+        """
+        # Always use margin vat_type_id for Margin Products (case insensitive)
+        if "margin product" in (product.description or "").lower():
+            # Hardcoded vat_type_id for margin products, with 0% VAT and the price from the Dokan order line as-is
+            return 688369464, 0.0, price
+
+        return self.vat_handler.determine_vat_for_line_item(
+            shipping_country, is_eu_country, price, product.vat_type_id, product.price_per_unit
+        )
+
+    @staticmethod
+    def build_invoice_line(product, fallback_description, quantity, vat):
+        """
+        Builds a Rompslomp invoice line for a product.
+
+        Args:
+            product (ResolvedProduct): The Rompslomp product of the line.
+            fallback_description (str): The description to use if the product has none.
+            quantity (int): The quantity of the line.
+            vat (tuple): The VAT type ID, VAT rate and price per unit of the line.
+
+        Returns:
+            dict: The invoice line.
+        """
+        vat_type_id, vat_rate, price_per_unit = vat
+        return {
+            "description": product.description or fallback_description,
+            "quantity": quantity,
+            "price_per_unit": price_per_unit,
+            "vat_rate": vat_rate,
+            "vat_type_id": vat_type_id,
+            "product_id": product.id,
+            "account_id": product.account_id,
+            "account_path": product.account_path
+        }
 
     def create_concept_invoice(self, order):
         """
@@ -487,120 +1244,72 @@ class InvoiceProcessor:
 
         Args:
             order (dict): The order data.
+
+        Returns:
+            bool: True if the invoice was created, False otherwise.
+
+        Raises:
+            TransientAPIError: If an API request failed with a transient error; the failure is not recorded.
         """
         if not validate_order_data(order):
-            self.failure_count += 1
-            self.failed_orders.append(order['id'])
-            return
+            self._record_failure(order['id'])
+            return False
 
         try:
-            # Extract customer information from Dokan order
-            customer = order['billing']
-            name = f"{customer['first_name']} {customer['last_name']}"
-            email = customer['email']
+            # Find or create the Rompslomp contact for the customer from the Dokan order, while the products are resolved
+            contact_future = self._lookup_executor.submit(self.get_or_create_contact, order['billing'])
 
-            # Check if contact exists in Rompslomp
-            contact_id = self.rompslomp_api.get_contact_id(email)
+            # Resolve the products for all line items with a single product search
+            skus = [item.get('sku') for item in order['line_items']]
+            products = self.resolve_products(skus)
+
+            contact_id = contact_future.result()
             if not contact_id:
-                logging.info(f"No contact found with email: {email}. Creating new contact.")
-                contact_data = {
-                    "contact": {
-                        "is_individual": True if 'company' not in customer or not customer['company'] else False,
-                        "is_supplier": True if 'company' in customer and customer['company'] else False,
-                        "company_name": customer['company'] if 'company' in customer and customer['company'] else None,
-                        "contact_person_name": f"{customer['first_name']} {customer['last_name']}",
-                        "contact_person_email_address": email,
-                        "address": f"{customer.get('address_1', '')}, {customer.get('address_2', '')}" if customer.get('address_2', '') else customer.get('address_1', ''),
-                        "zipcode": customer.get('postcode', ''),
-                        "city": customer.get('city', ''),
-                        "country_code": customer.get('country', 'NL'),  # Default to NL if country is missing
-                        "phone": customer.get('phone', None)
-                    }
-                }
-                contact = self.rompslomp_api.create_contact(contact_data)
-                if contact and 'contact' in contact and 'id' in contact['contact']:
-                    contact_id = contact['contact']['id']
-                    logging.info(f"Contact created successfully with ID: {contact_id}")
-                else:
-                    logging.error(f"Unexpected response format: {contact}")
-                    self.failure_count += 1
-                    self.failed_orders.append(order['id'])
-                    return
+                self._record_failure(order['id'])
+                return False
 
-            # Prepare invoice lines
-            lines = []
+            unmatched_skus = [sku for sku in skus if products[sku] is None]
+            if unmatched_skus:
+                logging.error("Product could not be matched, skipping invoice creation for SKU: %s", unmatched_skus[0])
+                self._record_failure(order['id'])
+                return False
 
-            # Add product lines
-            for item in order['line_items']:
-                sku = item.get('sku')
-                product_id, product_description, price_per_unit, price_with_vat, vat_rate, vat_type_id, account_id, account_path = self.rompslomp_api.get_product_id_by_sku(sku)
-                if not product_id:
-                    logging.error(f"Product could not be matched, skipping invoice creation for SKU: {sku}")
-                    self.failure_count += 1
-                    self.failed_orders.append(order['id'])
-                    return
-
-                shipping_country = order['shipping'].get('country', 'NL')
-                is_eu_country = shipping_country in EU_COUNTRIES
-
-                # Always use margin vat_type_id for Margin Products (case insensitive)
-                if "margin product" in (product_description or "").lower():
-                    vat_type_id = 688369464  # Hardcoded vat_type_id for margin products
-                    vat_rate = 0.0  # Margin products have 0% VAT
-                    price_per_unit = item.get('price', 0)  # Use the price from Dokan order line as-is for margin products
+            # The shipping country is the same for every line of the order
+            shipping_country = order['shipping'].get('country', 'NL')
+            is_eu_country = shipping_country in EU_COUNTRIES
 
-                else:
-                    vat_type_id, vat_rate, price_per_unit = self.vat_handler.determine_vat_for_line_item(
-                        shipping_country, is_eu_country, item.get('price', 0), vat_type_id, price_per_unit
-                    )
-
-                lines.append({
-                    "description": product_description if product_description else item['name'],
-                    "quantity": item['quantity'],
-                    "price_per_unit": price_per_unit,
-                    "vat_rate": vat_rate,
-                    "vat_type_id": vat_type_id,
-                    "product_id": product_id,
-                    "account_id": account_id,
-                    "account_path": account_path
-                })
-
-            # Add shipping line
+            # Add product lines
+            lines = [
+                self.build_invoice_line(
+                    products[sku], item['name'], item['quantity'],
+                    self.determine_vat_for_product(products[sku], item.get('price', 0), shipping_country, is_eu_country)
+                )
+                for item, sku in zip(order['line_items'], skus)
+            ]
+
+            # Add shipping line, using the shipping products resolved once per run
             shipping_mapping_dict = self.data_loader.load_shipping_mapping()
+            shipping_product_index = self.get_shipping_product_index()
             for shipping_line in order.get('shipping_lines', []):
                 method_title = shipping_line.get('method_title', '')
                 total = float(shipping_line.get('total', 0))
-                matching_row = shipping_mapping_dict.get((method_title, total))
-
-                if matching_row:
-                    sku = matching_row['SKU']
-                    product_id, product_description, price_per_unit, price_with_vat, vat_rate, vat_type_id, account_id, account_path = self.rompslomp_api.get_product_id_by_sku(sku)
-                    if product_id:
-                        shipping_country = order['shipping'].get('country', 'NL')
-                        is_eu_country = shipping_country in EU_COUNTRIES
-                        vat_type_id, vat_rate, price_per_unit = self.vat_handler.determine_vat_for_line_item(
-                            shipping_country, is_eu_country, total, vat_type_id, price_per_unit
-                        )
 
-                        lines.append({
-                            "description": product_description if product_description else method_title,
-                            "quantity": 1,
-                            "price_per_unit": price_per_unit,
-                            "vat_rate": vat_rate,
-                            "vat_type_id": vat_type_id,
-                            "product_id": product_id,
-                            "account_id": account_id,
-                            "account_path": account_path
-                        })
+                if (method_title, total) in shipping_mapping_dict:
+                    product = shipping_product_index.get((method_title, total))
+                    if product:
+                        vat = self.vat_handler.determine_vat_for_line_item(
+                            shipping_country, is_eu_country, total, product.vat_type_id, product.price_per_unit
+                        )
+                        lines.append(self.build_invoice_line(product, method_title, 1, vat))
                     else:
-                        logging.error(f"Shipping method could not be matched, skipping shipping line for method: {method_title}")
+                        logging.error("Shipping method could not be matched, skipping shipping line for method: %s", method_title)
 
             # Prepare invoice data
             invoice_date = order['date_created'].split('T')[0]  # Get the date from the Dokan order
-            due_date = (datetime.strptime(invoice_date, '%Y-%m-%d') + timedelta(days=30)).strftime('%Y-%m-%d')
+            due_date = (date.fromisoformat(invoice_date) + timedelta(days=30)).isoformat()
             invoice_data = {
                 "contact_id": contact_id,
-                "template_id": get_template_id(order['shipping'].get('country', 'NL')),
+                "template_id": get_template_id(shipping_country),
                 "payment_reference": order['id'],
                 "description": order['id'],
                 "invoice_lines": lines,
@@ -612,66 +1321,233 @@ class InvoiceProcessor:
             # Create the invoice in Rompslomp
             invoice = self.rompslomp_api.create_invoice(invoice_data)
             if not invoice:
-                self.failure_count += 1
-                self.failed_orders.append(order['id'])
-                return
+                self._record_failure(order['id'])
+                return False
+
+            self._record_success()
+            self._record_processed(order['id'])
+            # The order has been invoiced, so a later fetch should see its current state
+            lookup_cache.delete(f"order_{order['id']}")
+            logging.info("Invoice created successfully for order %s", order['id'])
+            return True
+
+        except TransientAPIError:
+            raise
+        except Exception as e:
+            logging.error("Failed to create invoice for order %s: %s", order['id'], e)
+            self._record_failure(order['id'])
+            return False
 
-            self.success_count += 1
-            logging.info(f"Invoice created successfully for order {order['id']}")
+    def _process_order(self, order):
+        if str(order['id']) in self.processed_orders:
+            logging.info("Order %s was already invoiced, skipping it.", order['id'])
+            return False
 
+        logging.info("Creating invoice for order %s...", order['id'])
+        try:
+            result = self.create_concept_invoice(order)
+        except TransientAPIError as e:
+            with self._lock:
+                attempts = self._retry_attempts.get(order['id'], 0)
+                if attempts < MAX_ORDER_RETRIES:
+                    self._retry_attempts[order['id']] = attempts + 1
+                    self.retry_stack.append(order)
+                    logging.warning("Transient error for order %s, retrying it later: %s", order['id'], e)
+                    return False
+            logging.error("Failed to create invoice for order %s after %s retries: %s", order['id'], MAX_ORDER_RETRIES, e)
+            self._record_failure(order['id'])
+            result = False
         except Exception as e:
-            logging.error(f"Failed to create invoice for order {order['id']}: {e}")
-            self.failure_count += 1
-            self.failed_orders.append(order['id'])
+            logging.error("Failed to create invoice for order %s: %s", order['id'], e)
+            self._record_failure(order['id'])
+            result = False
+
+        # The order is finished, so its retry count is no longer needed
+        with self._lock:
+            self._retry_attempts.pop(order['id'], None)
+        return result
+
+    def retry_failed_orders(self, executor, max_workers):
+        """
+        Processes the orders on the retry stack again until it is empty, taking the most recently failed orders first.
+
+        Orders that fail with a transient error again are pushed back onto the stack until they run out of retries.
+
+        Args:
+            executor (ThreadPoolExecutor): The pool to process the orders in.
+            max_workers (int): The maximum number of orders retried at the same time.
+        """
+        while True:
+            with self._lock:
+                batch = [self.retry_stack.pop() for _ in range(min(max_workers, len(self.retry_stack)))]
+            if not batch:
+                return
+            list(executor.map(self._process_order, batch))
+
+    def iter_orders_by_id(self, order_ids):
+        """
+        Yields the Dokan orders with the given IDs, recording IDs that could not be fetched as failed.
+
+        Args:
+            order_ids (iterable): The IDs of the orders to fetch.
+
+        Yields:
+            dict: The next order.
+        """
+        for order_id in order_ids:
+            logging.info("Fetching order with ID %s from Dokan...", order_id)
+            try:
+                order = self.dokan_api.get_order_by_id(order_id)
+            except TransientAPIError as e:
+                logging.error("Failed to fetch order %s: %s", order_id, e)
+                order = None
+            if not order:
+                logging.info("Order with ID %s not found.", order_id)
+                self._record_failure(order_id)
+                continue
+            yield order
+
+    def prefetch_products(self, orders, batch_size=25):
+        """
+        Yields the given orders, resolving the products of each batch of orders with a single product search first.
+
+        The resolved products are cached, so the invoices of the batch need no product requests of their own. Orders in
+        the processed orders checkpoint are still yielded, so their skip is logged, but their products are not searched.
+
+        Args:
+            orders (iterable): The orders to prefetch the products for.
+            batch_size (int): The number of orders whose SKUs are searched together.
+
+        Yields:
+            dict: The next order.
+        """
+        for batch in batched(orders, batch_size):
+            skus = [
+                item.get('sku')
+                for order in batch if str(order['id']) not in self.processed_orders
+                for item in order.get('line_items', []) if item.get('sku')
+            ]
+            if skus:
+                try:
+                    self.resolve_products(skus)
+                except Exception as e:
+                    # Each order resolves its own products again, so a failed prefetch only costs the shared request
+                    logging.warning("Failed to prefetch products for %s orders: %s", len(batch), e)
+            yield from batch
+
+    def process_orders(self, orders, max_workers=None):
+        """
+        Creates concept invoices for several orders concurrently.
+
+        Each order spends most of its time waiting on the Dokan and Rompslomp APIs, so orders are processed in a thread pool.
+        The number of workers is kept small to stay within the API rate limits.
+
+        Orders are taken from the iterable only as workers free up, so a paginated source is streamed: work starts after
+        the first page and only a few orders per worker are held in memory. The products of each batch of orders are
+        prefetched with a single search. Orders that failed with a transient error are retried at the end, and orders in
+        the processed orders checkpoint are skipped.
+
+        Args:
+            orders (iterable): The orders to process.
+            max_workers (int, optional): The maximum number of orders processed at the same time. Defaults to the configured MAX_WORKERS.
+        """
+        max_workers = max_workers or self.max_workers
+        orders = self.prefetch_products(orders)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            in_flight = {executor.submit(self._process_order, order) for order in itertools.islice(orders, max_workers * 2)}
+            while in_flight:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight |= {executor.submit(self._process_order, order) for order in itertools.islice(orders, len(done))}
+            self.retry_failed_orders(executor, max_workers)
+
+# Shared invoice processor, built once per process
+_invoice_processor = None
+_invoice_processor_lock = threading.Lock()
+
+def get_invoice_processor():
+    """
+    Initializes configuration, API handlers, and data loaders once and returns the shared invoice processor.
+
+    Returns:
+        InvoiceProcessor: The invoice processor for this process.
+    """
+    global _invoice_processor
+    with _invoice_processor_lock:
+        if _invoice_processor is None:
+            config = ConfigManager()
+            data_loader = DataLoader()
+            _invoice_processor = InvoiceProcessor(
+                DokanAPI(config), RompslompAPI(config), VATHandler(data_loader), data_loader, max_workers=config.max_workers
+            )
+            # Load the contacts and products cached by earlier runs into memory
+            lookup_cache.warm_up(('contact_', 'resolved_product_'))
+    return _invoice_processor
+
+def process_order(order_id):
+    """
+    Fetches a single order from Dokan and creates a concept invoice for it.
+
+    Args:
+        order_id (str): The ID of the order to process.
+
+    Returns:
+        dict: The result, with a "status" of "success", "already_invoiced", "in_progress" or "failed" and an "output" or
+            "error" message.
+    """
+    invoice_processor = get_invoice_processor()
+    # Never invoice an order twice, e.g. when the extension sends an order again after a timeout while the first
+    # request is still running
+    with invoice_processor._lock:
+        if str(order_id) in invoice_processor.processed_orders:
+            logging.info("Order %s was already invoiced, skipping it.", order_id)
+            return {"status": "already_invoiced", "output": f"Order {order_id} was already invoiced"}
+        if str(order_id) in invoice_processor.in_progress_orders:
+            logging.info("Order %s is already being invoiced, skipping it.", order_id)
+            return {"status": "in_progress", "output": f"Order {order_id} is already being invoiced"}
+        invoice_processor.in_progress_orders.add(str(order_id))
+
+    logging.info("Fetching order with ID %s from Dokan...", order_id)
+    try:
+        order = invoice_processor.dokan_api.get_order_by_id(order_id)
+        if not order:
+            logging.info("Order with ID %s not found.", order_id)
+            return {"status": "failed", "error": f"Order with ID {order_id} not found."}
+
+        logging.info("Creating invoice for order %s...", order['id'])
+        if invoice_processor.create_concept_invoice(order):
+            return {"status": "success", "output": f"Invoice created successfully for order {order['id']}"}
+    except TransientAPIError as e:
+        logging.error("Failed to create invoice for order %s: %s", order_id, e)
+        invoice_processor._record_failure(order_id)
+    finally:
+        with invoice_processor._lock:
+            invoice_processor.in_progress_orders.discard(str(order_id))
+    return {"status": "failed", "error": f"Failed to create invoice for order {order_id}"}
 
 # Main process
 if __name__ == "__main__":
     # Main process:
     # - Initializes configuration, API handlers, and data loaders.
-    # - If an order ID is provided as an argument, processes only that order.
+    # - If order IDs are provided as arguments, processes only those orders in this one run.
     # - Otherwise, processes all processing orders from Dokan.
     # - Logs a summary of successful and failed invoices at the end.
 
-    # Initialize configuration and APIs
-    config = ConfigManager()
-    dokan_api = DokanAPI(config)
-    rompslomp_api = RompslompAPI(config)
-    data_loader = DataLoader()
-    vat_handler = VATHandler(data_loader)
-
-    invoice_processor = InvoiceProcessor(dokan_api, rompslomp_api, vat_handler, data_loader)
+    invoice_processor = get_invoice_processor()
+    invoice_processor.preload()
 
+    # Both modes feed the same worker pool and bookkeeping: the given order IDs, or all processing orders
     if len(sys.argv) > 1:
-        # If an order ID is provided, process only that order
-        order_id = sys.argv[1]
-        logging.info(f"Fetching order with ID {order_id} from Dokan...")
-        order = dokan_api.get_order_by_id(order_id)
-        if order:
-            logging.info(f"Creating invoice for order {order['id']}...")
-            try:
-                invoice_processor.create_concept_invoice(order)
-            except Exception as e:
-                logging.error(f"Failed to create invoice for order {order['id']}: {e}")
-        else:
-            logging.info(f"Order with ID {order_id} not found.")
+        orders = invoice_processor.iter_orders_by_id(dict.fromkeys(sys.argv[1:]))  # Each ID once, in the given order
     else:
-        # Otherwise, process all processing orders
         logging.info("Fetching all processing orders from Dokan...")
-        orders = dokan_api.get_last_processing_order()
-        if orders:
-            for order in orders:
-                logging.info(f"Creating invoice for order {order['id']}...")
-                try:
-                    invoice_processor.create_concept_invoice(order)
-                except Exception as e:
-                    logging.error(f"Failed to create invoice for order {order['id']}: {e}")
-                    continue
-        else:
-            logging.info("No processing orders found.")
-
-    # Summary of results
-    logging.info(f"Summary: {invoice_processor.success_count} invoices processed successfully, {invoice_processor.failure_count} invoices failed.")
-    if invoice_processor.failed_orders:
-        logging.info(f"Failed orders: {', '.join(map(str, invoice_processor.failed_orders))}")
-    if invoice_processor.invoices_with_issues:
-        logging.info(f"Invoices with line item issues: {', '.join(map(str, invoice_processor.invoices_with_issues))}")
+        orders = invoice_processor.dokan_api.iter_processing_orders()
+    invoice_processor.process_orders(orders)
+    if invoice_processor.success_count + invoice_processor.failure_count == 0:
+        logging.info("No orders to invoice.")
+
+    # Summary of results, with long ID lists logged in chunks rather than one huge line
+    logging.info("Summary: %s invoices processed successfully, %s invoices failed.", invoice_processor.success_count, invoice_processor.failure_count)
+    for chunk in batched(invoice_processor.failed_orders, 50):
+        logging.info("Failed orders: %s", ', '.join(map(str, chunk)))
+    for chunk in batched(invoice_processor.invoices_with_issues, 50):
+        logging.info("Invoices with line item issues: %s", ', '.join(map(str, chunk)))